@@ -0,0 +1,195 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import google.api_core.exceptions
+import google.cloud.bigquery
+import google.cloud.datastore
+import google.cloud.exceptions
+import google.cloud.pubsub
+import google.cloud.storage
+import pytest
+
+from test_utils import BIGQUERY_DATASET_ID, BIGQUERY_TABLE_ID
+from test_utils import DATASTORE_KIND, GCLOUD_PROJECT
+from test_utils import RESOURCE_FILE_NAMES, RESOURCE_PATHS
+from test_utils import SHOULD_PASS_VPCSC, VPC_FAILURE_MESSAGE
+
+# When running under pytest-xdist every worker sets up its own copy of the
+# session fixtures, so suffix resource names to keep workers from sharing or
+# tearing down each other's resources. Tests are distributed with
+# --dist loadfile, so module-level fixtures and caches, such as those in
+# risk_test.py and inspect_content_test.py, stay within a single worker.
+WORKER_SUFFIX = (
+    '-' + os.environ['PYTEST_XDIST_WORKER']
+    if 'PYTEST_XDIST_WORKER' in os.environ else '')
+SUBSCRIPTION_ID = 'dlp-test-subscription' + WORKER_SUFFIX
+TEST_BUCKET_NAME = GCLOUD_PROJECT + '-dlp-python-client-test' + WORKER_SUFFIX
+TOPIC_ID = 'dlp-test' + WORKER_SUFFIX
+
+
+@pytest.fixture(scope='session')
+def resource_bytes():
+    # Reads each test resource file from disk once per session.
+    contents = {}
+    for name, path in RESOURCE_PATHS.items():
+        with open(path, 'rb') as f:
+            contents[name] = f.read()
+    return contents
+
+
+@pytest.fixture(scope='session')
+def storage_client():
+    # Shares a single GCS client, and its connection, across the session.
+    return google.cloud.storage.Client()
+
+
+@pytest.fixture(scope='session')
+def publisher_client():
+    # Shares a single Pub/Sub publisher, and its channel, across the session.
+    return google.cloud.pubsub.PublisherClient()
+
+
+@pytest.fixture(scope='session')
+def subscriber_client():
+    # Shares a single Pub/Sub subscriber, and its channel, across the session.
+    return google.cloud.pubsub.SubscriberClient()
+
+
+@pytest.fixture(scope='session')
+def datastore_client():
+    # Shares a single Datastore client across the session.
+    return google.cloud.datastore.Client()
+
+
+@pytest.fixture(scope='session')
+def bigquery_client():
+    # Shares a single BigQuery client across the session.
+    return google.cloud.bigquery.Client()
+
+
+@pytest.fixture(scope='session')
+def bucket(storage_client):
+    # Creates a GCS bucket, uploads files required for the test, and tears down
+    # the entire bucket afterwards.
+    try:
+        bucket = storage_client.create_bucket(TEST_BUCKET_NAME)
+    except google.api_core.exceptions.Conflict:
+        bucket = storage_client.get_bucket(TEST_BUCKET_NAME)
+    except google.api_core.exceptions.PermissionDenied as e:
+        if "Request is prohibited by organization's policy." in e.message:
+            pytest.skip(VPC_FAILURE_MESSAGE)
+        raise
+    except google.api_core.exceptions.Forbidden as e:
+        if "Request violates VPC Service Controls." in e.message:
+            pytest.skip(VPC_FAILURE_MESSAGE)
+        raise
+
+    def _upload(name):
+        blob = bucket.blob(name)
+        blob.upload_from_filename(RESOURCE_PATHS[name])
+        return blob
+
+    # Upload the blobs concurrently.
+    with ThreadPoolExecutor(max_workers=len(RESOURCE_FILE_NAMES)) as executor:
+        list(executor.map(_upload, RESOURCE_FILE_NAMES))
+
+    # Yield the object to the test; lines after this execute as a teardown.
+    yield bucket
+
+    # Delete the bucket along with all of its files.
+    try:
+        bucket.delete(force=True)
+    except google.cloud.exceptions.NotFound:
+        print('Issue during teardown, missing bucket')
+
+
+@pytest.fixture(scope='session')
+def topic_id(publisher_client):
+    # Creates a pubsub topic, and tears it down.
+    topic_path = publisher_client.topic_path(GCLOUD_PROJECT, TOPIC_ID)
+    try:
+        publisher_client.create_topic(topic_path)
+    except google.api_core.exceptions.AlreadyExists:
+        pass
+
+    yield TOPIC_ID
+
+    publisher_client.delete_topic(topic_path)
+
+
+@pytest.fixture(scope='session')
+def subscription_id(subscriber_client, topic_id):
+    # Subscribes to a topic.
+    topic_path = subscriber_client.topic_path(GCLOUD_PROJECT, topic_id)
+    subscription_path = subscriber_client.subscription_path(
+        GCLOUD_PROJECT, SUBSCRIPTION_ID)
+    try:
+        subscriber_client.create_subscription(subscription_path, topic_path)
+    except google.api_core.exceptions.AlreadyExists:
+        pass
+
+    yield SUBSCRIPTION_ID
+
+    subscriber_client.delete_subscription(subscription_path)
+
+
+@pytest.fixture(scope='session')
+def datastore_project(datastore_client):
+    # Adds test Datastore data, yields the project ID and then tears down.
+    if not SHOULD_PASS_VPCSC:
+        pytest.skip(VPC_FAILURE_MESSAGE)
+    kind = DATASTORE_KIND
+    name = 'DLP test object' + WORKER_SUFFIX
+    key = datastore_client.key(kind, name)
+    item = google.cloud.datastore.Entity(key=key)
+    item['payload'] = 'My name is Gary Smith and my email is gary@example.com'
+
+    datastore_client.put(item)
+
+    yield GCLOUD_PROJECT
+
+    datastore_client.delete(key)
+
+
+@pytest.fixture(scope='session')
+def bigquery_project(bigquery_client):
+    # Adds test Bigquery data, yields the project ID and then tears down.
+    dataset_ref = bigquery_client.dataset(BIGQUERY_DATASET_ID)
+    dataset = google.cloud.bigquery.Dataset(dataset_ref)
+    dataset = bigquery_client.create_dataset(dataset, exists_ok=True)
+
+    table_ref = dataset_ref.table(BIGQUERY_TABLE_ID)
+    table = google.cloud.bigquery.Table(table_ref)
+
+    # DO NOT SUBMIT: trim this down once we find out what works
+    table.schema = (
+        google.cloud.bigquery.SchemaField('Name', 'STRING'),
+        google.cloud.bigquery.SchemaField('Comment', 'STRING'),
+    )
+
+    table = bigquery_client.create_table(table, exists_ok=True)
+
+    # Insert all rows in a single streaming request.
+    rows_to_insert = [
+        {u'Name': u'Gary Smith', u'Comment': u'My email is gary@example.com'},
+    ]
+
+    bigquery_client.insert_rows_json(table, rows_to_insert)
+
+    yield GCLOUD_PROJECT
+
+    bigquery_client.delete_dataset(dataset_ref, delete_contents=True)
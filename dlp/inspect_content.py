@@ -39,7 +39,7 @@ def inspect_string(project, content_string, info_types,
         include_quote: Boolean for whether to display a quote of the detected
             information in the results.
     Returns:
-        None; the response from the API is printed to the terminal.
+        A list of the findings; they are also printed to the terminal.
     """
 
     # Import the client library.
@@ -101,8 +101,112 @@ def inspect_string(project, content_string, info_types,
             print('Likelihood: {}'.format(finding.likelihood))
     else:
         print('No findings.')
+
+    return list(response.result.findings)
 # [END dlp_inspect_string]
 
+
+# [START dlp_inspect_strings_batch]
+def inspect_strings_batch(project, items, info_types,
+                          custom_dictionaries=None, custom_regexes=None,
+                          min_likelihood=None, max_findings=None,
+                          include_quote=True):
+    """Uses the Data Loss Prevention API to analyze several strings at once.
+    The strings are sent as the rows of a single-column table, so that only
+    one request is made regardless of how many strings are inspected.
+    Args:
+        project: The Google Cloud project id to use as a parent resource.
+        items: A list of strings to inspect.
+        info_types: A list of strings representing info types to look for.
+            A full list of info type categories can be fetched from the API.
+        custom_dictionaries: A list of strings, each a comma-delimited list of
+            words to look for as a custom dictionary info type.
+        custom_regexes: A list of strings, each a regex pattern to look for as
+            a custom regex info type.
+        min_likelihood: A string representing the minimum likelihood threshold
+            that constitutes a match. One of: 'LIKELIHOOD_UNSPECIFIED',
+            'VERY_UNLIKELY', 'UNLIKELY', 'POSSIBLE', 'LIKELY', 'VERY_LIKELY'.
+        max_findings: The maximum number of findings to report; 0 = no maximum.
+        include_quote: Boolean for whether to display a quote of the detected
+            information in the results.
+    Returns:
+        A list with one entry per input string, each a list of the findings
+        for that string. The results are also printed to the terminal.
+    """
+
+    # Import the client library.
+    import google.cloud.dlp
+
+    # Instantiate a client.
+    dlp = google.cloud.dlp.DlpServiceClient()
+
+    # Prepare info_types by converting the list of strings into a list of
+    # dictionaries (protos are also accepted).
+    info_types = [{'name': info_type} for info_type in info_types]
+
+    # Prepare custom_info_types by parsing the dictionary word lists and
+    # regex patterns.
+    if custom_dictionaries is None:
+        custom_dictionaries = []
+    dictionaries = [{
+        'info_type': {'name': 'CUSTOM_DICTIONARY_{}'.format(i)},
+        'dictionary': {
+            'word_list': {'words': custom_dict.split(',')}
+        }
+    } for i, custom_dict in enumerate(custom_dictionaries)]
+    if custom_regexes is None:
+        custom_regexes = []
+    regexes = [{
+        'info_type': {'name': 'CUSTOM_REGEX_{}'.format(i)},
+        'regex': {'pattern': custom_regex}
+    } for i, custom_regex in enumerate(custom_regexes)]
+    custom_info_types = dictionaries + regexes
+
+    # Construct the configuration dictionary. Keys which are None may
+    # optionally be omitted entirely.
+    inspect_config = {
+        'info_types': info_types,
+        'custom_info_types': custom_info_types,
+        'min_likelihood': min_likelihood,
+        'include_quote': include_quote,
+        'limits': {'max_findings_per_request': max_findings},
+    }
+
+    # Construct a single-column `table` with one row per string.
+    rows = [{'values': [{'string_value': value}]} for value in items]
+    item = {'table': {'headers': [{'name': 'value'}], 'rows': rows}}
+
+    # Convert the project id into a full resource id.
+    parent = dlp.project_path(project)
+
+    # Call the API.
+    response = dlp.inspect_content(parent, inspect_config, item)
+
+    # Group the findings by the row they were found in.
+    findings = [[] for _ in items]
+    for finding in response.result.findings:
+        location = finding.location.content_locations[0]
+        row_index = location.record_location.table_location.row_index
+        findings[row_index].append(finding)
+
+    # Print out the results.
+    for row_index, row_findings in enumerate(findings):
+        print('Row {}:'.format(row_index))
+        if row_findings:
+            for finding in row_findings:
+                try:
+                    if finding.quote:
+                        print('Quote: {}'.format(finding.quote))
+                except AttributeError:
+                    pass
+                print('Info type: {}'.format(finding.info_type.name))
+                print('Likelihood: {}'.format(finding.likelihood))
+        else:
+            print('No findings.')
+
+    return findings
+# [END dlp_inspect_strings_batch]
+
 # [START dlp_inspect_table]
 
 
@@ -122,7 +226,7 @@ def inspect_table(project, data, info_types,
         include_quote: Boolean for whether to display a quote of the detected
             information in the results.
     Returns:
-        None; the response from the API is printed to the terminal.
+        A list of the findings; they are also printed to the terminal.
     Example:
         data = {
             "header":[
@@ -222,18 +326,21 @@ def inspect_table(project, data, info_types,
             print('Likelihood: {}'.format(finding.likelihood))
     else:
         print('No findings.')
+
+    return list(response.result.findings)
 # [END dlp_inspect_table]
 
 # [START dlp_inspect_file]
 
 
-def inspect_file(project, filename, info_types, min_likelihood=None,
-                 custom_dictionaries=None, custom_regexes=None,
-                 max_findings=None, include_quote=True, mime_type=None):
-    """Uses the Data Loss Prevention API to analyze a file for protected data.
+def inspect_bytes(project, data, info_types, min_likelihood=None,
+                  custom_dictionaries=None, custom_regexes=None,
+                  max_findings=None, include_quote=True, mime_type=None):
+    """Uses the Data Loss Prevention API to analyze file contents for
+    protected data.
     Args:
         project: The Google Cloud project id to use as a parent resource.
-        filename: The path to the file to inspect.
+        data: The contents of the file to inspect, as bytes.
         info_types: A list of strings representing info types to look for.
             A full list of info type categories can be fetched from the API.
         min_likelihood: A string representing the minimum likelihood threshold
@@ -242,13 +349,13 @@ def inspect_file(project, filename, info_types, min_likelihood=None,
         max_findings: The maximum number of findings to report; 0 = no maximum.
         include_quote: Boolean for whether to display a quote of the detected
             information in the results.
-        mime_type: The MIME type of the file. If not specified, the type is
-            inferred via the Python standard library's mimetypes module.
+        mime_type: The MIME type of the data. If not specified, the type is
+            left unspecified and the API attempts to detect it.
     Returns:
-        None; the response from the API is printed to the terminal.
+        A list of the findings; they are also printed to the terminal.
     """
 
-    import mimetypes
+    import concurrent.futures
 
     # Import the client library.
     import google.cloud.dlp
@@ -289,11 +396,6 @@ def inspect_file(project, filename, info_types, min_likelihood=None,
         'limits': {'max_findings_per_request': max_findings},
     }
 
-    # If mime_type is not specified, guess it from the filename.
-    if mime_type is None:
-        mime_guess = mimetypes.MimeTypes().guess_type(filename)
-        mime_type = mime_guess[0]
-
     # Select the content type index from the list of supported types.
     supported_content_types = {
         None: 0,  # "Unspecified"
@@ -305,19 +407,84 @@ def inspect_file(project, filename, info_types, min_likelihood=None,
     }
     content_type_index = supported_content_types.get(mime_type, 0)
 
-    # Construct the item, containing the file's byte data.
-    with open(filename, mode='rb') as f:
-        item = {'byte_item': {'type': content_type_index, 'data': f.read()}}
+    # The API rejects requests with more than 524288 bytes of content, so
+    # split large plain text files on line boundaries into smaller chunks.
+    # Other content, such as images, cannot be split and is sent whole.
+    max_chunk_size = 500000
+
+    def split_line(line):
+        # Split a line longer than a chunk without cutting a UTF-8 character
+        # in half, by backing off over continuation bytes (0b10xxxxxx).
+        while len(line) > max_chunk_size:
+            cut = max_chunk_size
+            while cut > 0 and ord(line[cut:cut + 1]) & 0xC0 == 0x80:
+                cut -= 1
+            cut = cut or max_chunk_size
+            yield line[:cut]
+            line = line[cut:]
+        yield line
+
+    chunks = [data]
+    if len(data) > max_chunk_size and mime_type == 'text/plain':
+        chunks = []
+        pieces = []
+        size = 0
+        for line in data.splitlines(True):
+            for piece in split_line(line):
+                if size + len(piece) > max_chunk_size:
+                    chunks.append(b''.join(pieces))
+                    pieces = []
+                    size = 0
+                pieces.append(piece)
+                size += len(piece)
+        chunks.append(b''.join(pieces))
+
+    # Record where each chunk starts in the file, in bytes and in code
+    # points, so that finding locations can be made relative to the file.
+    chunk_offsets = []
+    byte_offset = 0
+    codepoint_offset = 0
+    for chunk in chunks:
+        chunk_offsets.append((byte_offset, codepoint_offset))
+        byte_offset += len(chunk)
+        if len(chunks) > 1:
+            codepoint_offset += len(chunk.decode('utf-8', 'replace'))
 
     # Convert the project id into a full resource id.
     parent = dlp.project_path(project)
 
-    # Call the API.
-    response = dlp.inspect_content(parent, inspect_config, item)
+    def inspect_chunk(chunk, offsets):
+        # Construct the item, containing the chunk's byte data.
+        item = {'byte_item': {'type': content_type_index, 'data': chunk}}
+
+        # Call the API.
+        response = dlp.inspect_content(parent, inspect_config, item)
+
+        # Shift the finding locations from the chunk to the whole file. Data
+        # sent whole is left alone, so its findings are returned unchanged.
+        chunk_findings = list(response.result.findings)
+        if len(chunks) > 1:
+            for finding in chunk_findings:
+                finding.location.byte_range.start += offsets[0]
+                finding.location.byte_range.end += offsets[0]
+                finding.location.codepoint_range.start += offsets[1]
+                finding.location.codepoint_range.end += offsets[1]
+        return chunk_findings
+
+    # Inspect the chunks in parallel and merge their findings. The findings
+    # limit applies to each request, so apply it again to the merged list.
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        findings = [
+            finding
+            for chunk_findings in executor.map(
+                inspect_chunk, chunks, chunk_offsets)
+            for finding in chunk_findings]
+    if max_findings:
+        findings = findings[:max_findings]
 
     # Print out the results.
-    if response.result.findings:
-        for finding in response.result.findings:
+    if findings:
+        for finding in findings:
             try:
                 print('Quote: {}'.format(finding.quote))
             except AttributeError:
@@ -326,6 +493,50 @@ def inspect_file(project, filename, info_types, min_likelihood=None,
             print('Likelihood: {}'.format(finding.likelihood))
     else:
         print('No findings.')
+
+    return findings
+
+
+def inspect_file(project, filename, info_types, min_likelihood=None,
+                 custom_dictionaries=None, custom_regexes=None,
+                 max_findings=None, include_quote=True, mime_type=None):
+    """Uses the Data Loss Prevention API to analyze a file for protected data.
+    Args:
+        project: The Google Cloud project id to use as a parent resource.
+        filename: The path to the file to inspect.
+        info_types: A list of strings representing info types to look for.
+            A full list of info type categories can be fetched from the API.
+        min_likelihood: A string representing the minimum likelihood threshold
+            that constitutes a match. One of: 'LIKELIHOOD_UNSPECIFIED',
+            'VERY_UNLIKELY', 'UNLIKELY', 'POSSIBLE', 'LIKELY', 'VERY_LIKELY'.
+        max_findings: The maximum number of findings to report; 0 = no maximum.
+        include_quote: Boolean for whether to display a quote of the detected
+            information in the results.
+        mime_type: The MIME type of the file. If not specified, the type is
+            inferred via the Python standard library's mimetypes module.
+    Returns:
+        A list of the findings; they are also printed to the terminal.
+    """
+
+    import mimetypes
+
+    # If mime_type is not specified, guess it from the filename.
+    if mime_type is None:
+        mime_guess = mimetypes.MimeTypes().guess_type(filename)
+        mime_type = mime_guess[0]
+
+    # Read the file's byte data.
+    with open(filename, mode='rb') as f:
+        data = f.read()
+
+    return inspect_bytes(
+        project, data, info_types,
+        min_likelihood=min_likelihood,
+        custom_dictionaries=custom_dictionaries,
+        custom_regexes=custom_regexes,
+        max_findings=max_findings,
+        include_quote=include_quote,
+        mime_type=mime_type)
 # [END dlp_inspect_file]
 
 
@@ -353,7 +564,9 @@ def inspect_gcs_file(project, bucket, filename, topic_id, subscription_id,
         max_findings: The maximum number of findings to report; 0 = no maximum.
         timeout: The number of seconds to wait for a response from the API.
     Returns:
-        None; the response from the API is printed to the terminal.
+        A list of the info type statistics for the completed job, which are
+        also printed to the terminal, or None if no notification was received
+        before the timeout.
     """
 
     # Import the client library.
@@ -436,6 +649,7 @@ def inspect_gcs_file(project, bucket, filename, topic_id, subscription_id,
     # Set up a callback to acknowledge a message. This closes around an event
     # so that it can signal that it is done and the main thread can continue.
     job_done = threading.Event()
+    info_type_stats = []
 
     def callback(message):
         try:
@@ -445,8 +659,10 @@ def inspect_gcs_file(project, bucket, filename, topic_id, subscription_id,
 
                 # Now that the job is done, fetch the results and print them.
                 job = dlp.get_dlp_job(operation.name)
-                if job.inspect_details.result.info_type_stats:
-                    for finding in job.inspect_details.result.info_type_stats:
+                # Replace rather than extend, in case of a redelivery.
+                info_type_stats[:] = job.inspect_details.result.info_type_stats
+                if info_type_stats:
+                    for finding in info_type_stats:
                         print('Info type: {}; Count: {}'.format(
                             finding.info_type.name, finding.count))
                 else:
@@ -463,11 +679,22 @@ def inspect_gcs_file(project, bucket, filename, topic_id, subscription_id,
             print(e)
             raise
 
-    subscriber.subscribe(subscription_path, callback=callback)
+    # Open a streaming pull that delivers messages to the callback as soon
+    # as they are published, and wait on the event.
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=callback)
     finished = job_done.wait(timeout=timeout)
+
+    # Stop the streaming pull so that it does not keep receiving, and
+    # holding, messages meant for later jobs.
+    streaming_pull_future.cancel()
+
     if not finished:
         print('No event received before the timeout. Please verify that the '
               'subscription provided is subscribed to the topic provided.')
+        return None
+
+    return info_type_stats
 
 # [END dlp_inspect_gcs]
 
@@ -497,7 +724,9 @@ def inspect_datastore(project, datastore_project, kind,
         max_findings: The maximum number of findings to report; 0 = no maximum.
         timeout: The number of seconds to wait for a response from the API.
     Returns:
-        None; the response from the API is printed to the terminal.
+        A list of the info type statistics for the completed job, which are
+        also printed to the terminal, or None if no notification was received
+        before the timeout.
     """
 
     # Import the client library.
@@ -585,6 +814,7 @@ def inspect_datastore(project, datastore_project, kind,
     # Set up a callback to acknowledge a message. This closes around an event
     # so that it can signal that it is done and the main thread can continue.
     job_done = threading.Event()
+    info_type_stats = []
 
     def callback(message):
         try:
@@ -594,8 +824,10 @@ def inspect_datastore(project, datastore_project, kind,
 
                 # Now that the job is done, fetch the results and print them.
                 job = dlp.get_dlp_job(operation.name)
-                if job.inspect_details.result.info_type_stats:
-                    for finding in job.inspect_details.result.info_type_stats:
+                # Replace rather than extend, in case of a redelivery.
+                info_type_stats[:] = job.inspect_details.result.info_type_stats
+                if info_type_stats:
+                    for finding in info_type_stats:
                         print('Info type: {}; Count: {}'.format(
                             finding.info_type.name, finding.count))
                 else:
@@ -612,13 +844,22 @@ def inspect_datastore(project, datastore_project, kind,
             print(e)
             raise
 
-    # Register the callback and wait on the event.
-    subscriber.subscribe(subscription_path, callback=callback)
-
+    # Open a streaming pull that delivers messages to the callback as soon
+    # as they are published, and wait on the event.
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=callback)
     finished = job_done.wait(timeout=timeout)
+
+    # Stop the streaming pull so that it does not keep receiving, and
+    # holding, messages meant for later jobs.
+    streaming_pull_future.cancel()
+
     if not finished:
         print('No event received before the timeout. Please verify that the '
               'subscription provided is subscribed to the topic provided.')
+        return None
+
+    return info_type_stats
 
 # [END dlp_inspect_datastore]
 
@@ -648,7 +889,9 @@ def inspect_bigquery(project, bigquery_project, dataset_id, table_id,
         max_findings: The maximum number of findings to report; 0 = no maximum.
         timeout: The number of seconds to wait for a response from the API.
     Returns:
-        None; the response from the API is printed to the terminal.
+        A list of the info type statistics for the completed job, which are
+        also printed to the terminal, or None if no notification was received
+        before the timeout.
     """
 
     # Import the client library.
@@ -734,6 +977,7 @@ def inspect_bigquery(project, bigquery_project, dataset_id, table_id,
     # Set up a callback to acknowledge a message. This closes around an event
     # so that it can signal that it is done and the main thread can continue.
     job_done = threading.Event()
+    info_type_stats = []
 
     def callback(message):
         try:
@@ -743,8 +987,10 @@ def inspect_bigquery(project, bigquery_project, dataset_id, table_id,
 
                 # Now that the job is done, fetch the results and print them.
                 job = dlp.get_dlp_job(operation.name)
-                if job.inspect_details.result.info_type_stats:
-                    for finding in job.inspect_details.result.info_type_stats:
+                # Replace rather than extend, in case of a redelivery.
+                info_type_stats[:] = job.inspect_details.result.info_type_stats
+                if info_type_stats:
+                    for finding in info_type_stats:
                         print('Info type: {}; Count: {}'.format(
                             finding.info_type.name, finding.count))
                 else:
@@ -761,12 +1007,22 @@ def inspect_bigquery(project, bigquery_project, dataset_id, table_id,
             print(e)
             raise
 
-    # Register the callback and wait on the event.
-    subscriber.subscribe(subscription_path, callback=callback)
+    # Open a streaming pull that delivers messages to the callback as soon
+    # as they are published, and wait on the event.
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=callback)
     finished = job_done.wait(timeout=timeout)
+
+    # Stop the streaming pull so that it does not keep receiving, and
+    # holding, messages meant for later jobs.
+    streaming_pull_future.cancel()
+
     if not finished:
         print('No event received before the timeout. Please verify that the '
               'subscription provided is subscribed to the topic provided.')
+        return None
+
+    return info_type_stats
 
 # [END dlp_inspect_bigquery]
 
@@ -818,6 +1074,47 @@ if __name__ == '__main__':
              'information in the results.',
         default=True)
 
+    parser_string_batch = subparsers.add_parser(
+        'string_batch', help='Inspect several strings in one request.')
+    parser_string_batch.add_argument(
+        'items', nargs='+', help='The strings to inspect.')
+    parser_string_batch.add_argument(
+        '--project',
+        help='The Google Cloud project id to use as a parent resource.',
+        default=default_project)
+    parser_string_batch.add_argument(
+        '--info_types', nargs='+',
+        help='Strings representing info types to look for. A full list of '
+             'info categories and types is available from the API. Examples '
+             'include "FIRST_NAME", "LAST_NAME", "EMAIL_ADDRESS". '
+             'If unspecified, the three above examples will be used.',
+        default=['FIRST_NAME', 'LAST_NAME', 'EMAIL_ADDRESS'])
+    parser_string_batch.add_argument(
+        '--custom_dictionaries', action='append',
+        help='Strings representing comma-delimited lists of dictionary words'
+             ' to search for as custom info types. Each string is a comma '
+             'delimited list of words representing a distinct dictionary.',
+        default=None)
+    parser_string_batch.add_argument(
+        '--custom_regexes', action='append',
+        help='Strings representing regex patterns to search for as custom '
+             ' info types.',
+        default=None)
+    parser_string_batch.add_argument(
+        '--min_likelihood',
+        choices=['LIKELIHOOD_UNSPECIFIED', 'VERY_UNLIKELY', 'UNLIKELY',
+                 'POSSIBLE', 'LIKELY', 'VERY_LIKELY'],
+        help='A string representing the minimum likelihood threshold that '
+             'constitutes a match.')
+    parser_string_batch.add_argument(
+        '--max_findings', type=int,
+        help='The maximum number of findings to report; 0 = no maximum.')
+    parser_string_batch.add_argument(
+        '--include_quote', type=bool,
+        help='A boolean for whether to display a quote of the detected '
+             'information in the results.',
+        default=True)
+
     parser_table = subparsers.add_parser('table', help='Inspect a table.')
     parser_table.add_argument(
         'data', help='Json string representing a table.', type=json.loads)
@@ -1083,6 +1380,14 @@ if __name__ == '__main__':
             min_likelihood=args.min_likelihood,
             max_findings=args.max_findings,
             include_quote=args.include_quote)
+    elif args.content == 'string_batch':
+        inspect_strings_batch(
+            args.project, args.items, args.info_types,
+            custom_dictionaries=args.custom_dictionaries,
+            custom_regexes=args.custom_regexes,
+            min_likelihood=args.min_likelihood,
+            max_findings=args.max_findings,
+            include_quote=args.include_quote)
     elif args.content == 'table':
         inspect_table(
             args.project, args.data, args.info_types,
@@ -14,7 +14,7 @@ if os.path.exists("samples"):
 def setup(session):
     # Same as pip install -r -r requirements.txt.
     session.install("-r", "requirements.txt")
-    session.install("mock", "pytest", "decorator")
+    session.install("mock", "pytest", "pytest-xdist==1.30.0", "decorator")
 
     if not os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", ""):
         session.skip("Credentials must be set via environment variable")
@@ -30,7 +30,9 @@ def tests_should_pass(session):
     tests_path = "."
     if not os.path.exists(tests_path):
         session.skip("tests were not found")
-    session.run("pytest", "--quiet", tests_path, env=env)
+    session.run(
+        "pytest", "--quiet", "-n", "auto", "--dist", "loadfile", tests_path,
+        env=env)
 
 
 @nox.session
@@ -7,6 +7,19 @@ from google.api_core import exceptions
 SHOULD_PASS_VPCSC = os.getenv('SHOULD_PASS_VPCSC', "false").lower() == "true"
 VPC_FAILURE_MESSAGE = "Expected to fail if VPCSC is misconfigured."
 
+# Resources shared by the test fixtures and the tests that use them.
+GCLOUD_PROJECT = os.getenv('GCLOUD_PROJECT')
+BIGQUERY_DATASET_ID = 'dlp_test_dataset'
+BIGQUERY_TABLE_ID = 'dlp_test_table'
+DATASTORE_KIND = 'DLP test kind'
+
+# Test resource files, keyed by name to their paths on disk.
+RESOURCE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'resources')
+RESOURCE_FILE_NAMES = ['test.txt', 'test.png', 'harmless.txt', 'accounts.txt']
+RESOURCE_PATHS = {
+    name: os.path.join(RESOURCE_DIRECTORY, name)
+    for name in RESOURCE_FILE_NAMES}
+
 # VPCSC function wrappers.
 ##################################################
 @pytest.mark.xfail